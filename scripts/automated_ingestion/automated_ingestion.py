@@ -42,12 +42,14 @@ def find_tarballs(s3, bucket, extension='.tar.gz', metadata_extension='.meta.txt
     # TODO: list_objects_v2 only returns up to 1000 objects
     s3_objects = s3.list_objects_v2(Bucket=bucket).get('Contents', [])
     files = [obj['Key'] for obj in s3_objects]
+    # set of all files, for looking up the metadata file of each tarball
+    files_set = set(files)
 
     tarballs = [
         file
         for file in files
         if file.endswith(extension)
-           and file + metadata_extension in files
+           and file + metadata_extension in files_set
     ]
     return tarballs
 
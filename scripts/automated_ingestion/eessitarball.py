@@ -19,27 +19,26 @@ class EessiTarball:
     for which it interfaces with the S3 bucket, GitHub, and CVMFS.
     """
 
+    # Latest known commit SHA and set of file paths of git repository branches, indexed by (repository, branch).
+    git_trees = {}
+
     def __init__(self, object_name, config, git_staging_repo, s3, bucket, cvmfs_repo):
         """Initialize the tarball object."""
         self.config = config
         self.git_repo = git_staging_repo
         self.metadata_file = object_name + config['paths']['metadata_file_extension']
         self.object = object_name
+        self.filename = os.path.basename(object_name)
         self.s3 = s3
         self.bucket = bucket
         self.cvmfs_repo = cvmfs_repo
-        self.local_path = os.path.join(config['paths']['download_dir'], os.path.basename(object_name))
+        self.local_path = os.path.join(config['paths']['download_dir'], self.filename)
         self.local_metadata_path = self.local_path + config['paths']['metadata_file_extension']
+        # Contents of the downloaded metadata file, read on first use.
+        self.metadata = None
         self.url = f'https://{bucket}.s3.amazonaws.com/{object_name}'
-
-        self.states = {
-            'new': {'handler': self.mark_new_tarball_as_staged, 'next_state': 'staged'},
-            'staged': {'handler': self.make_approval_request, 'next_state': 'approved'},
-            'approved': {'handler': self.ingest, 'next_state': 'ingested'},
-            'ingested': {'handler': self.print_ingested},
-            'rejected': {'handler': self.print_rejected},
-            'unknown': {'handler': self.print_unknown},
-        }
+        # Metadata files fetched from the git repository, indexed by state; cleared when the file is moved.
+        self.git_metadata_files = {}
 
         # Find the initial state of this tarball.
         self.state = self.find_state()
@@ -57,6 +56,7 @@ class EessiTarball:
                 )
                 self.local_path = None
         if force or not os.path.exists(self.local_metadata_path):
+            self.metadata = None
             try:
                 self.s3.download_file(self.bucket, self.metadata_file, self.local_metadata_path)
             except:
@@ -65,34 +65,82 @@ class EessiTarball:
                 )
                 self.local_metadata_path = None
 
+    def get_metadata(self):
+        """Return the contents of the downloaded metadata file of this tarball, reading it only once."""
+        if self.metadata is None:
+            with open(self.local_metadata_path, 'r') as meta:
+                self.metadata = meta.read()
+        return self.metadata
+
     def find_state(self):
         """Find the state of this tarball by searching through the state directories in the git repository."""
-        for state in list(self.states.keys()):
-            # iterate through the state dirs and try to find the tarball's metadata file
-            try:
-                self.git_repo.get_contents(state + '/' + self.metadata_file)
-                return state
-            except github.UnknownObjectException:
-                # no metadata file found in this state's directory, so keep searching...
-                continue
-            except github.GithubException as e:
-                if e.status == 404:
-                    # no metadata file found in this state's directory, so keep searching...
+        try:
+            paths = self.get_git_tree_paths('main')
+            for state in self.states:
+                # iterate through the state dirs and try to find the tarball's metadata file
+                if paths is not None:
+                    if state + '/' + self.metadata_file in paths:
+                        return state
                     continue
-                else:
-                    # if there was some other (e.g. connection) issue, abort the search for this tarball
-                    logging.warning(f'Unable to determine the state of {self.object}, the GitHub API returned status {e.status}!')
-                    return "unknown"
-        else:
-            # if no state was found, we assume this is a new tarball that was ingested to the bucket
-            return "new"
+                # the listing of the repository was incomplete, so look for the metadata file itself
+                try:
+                    self.get_git_metadata_file(state)
+                    return state
+                except github.GithubException as e:
+                    if e.status == 404:
+                        # no metadata file found in this state's directory, so keep searching...
+                        continue
+                    raise
+        except github.GithubException as e:
+            # if there was some (e.g. connection) issue, abort the search for this tarball
+            logging.warning(f'Unable to determine the state of {self.object}, the GitHub API returned status {e.status}!')
+            return "unknown"
+        # if no state was found, we assume this is a new tarball that was ingested to the bucket
+        return "new"
+
+    def get_git_tree_paths(self, branch):
+        """
+        Return the paths of all files in the given branch of the git repository,
+        or None if the repository is too large for GitHub to list all of them.
+        """
+        # The tree of a commit never changes, so it is shared by all tarballs and only fetched again
+        # when the branch has moved to a commit that was not made by this script (see update_git_tree_paths).
+        key = (self.git_repo.full_name, branch)
+        if key in self.git_trees and self.git_trees[key][1] is None:
+            # The listing was incomplete before, and files are hardly ever removed from the repository,
+            # so it will be incomplete again: don't bother to check the branch and download its tree.
+            return None
+        sha = self.git_repo.get_branch(branch).commit.sha
+        if key not in self.git_trees or self.git_trees[key][0] != sha:
+            tree = self.git_repo.get_git_tree(sha, recursive=True)
+            # (GitTree only has a truncated attribute in recent PyGithub versions, so read it from the raw data)
+            paths = None if tree.raw_data.get('truncated', False) else {element.path for element in tree.tree}
+            self.git_trees[key] = (sha, paths)
+        return self.git_trees[key][1]
+
+    def update_git_tree_paths(self, branch, commit, added=(), removed=()):
+        """Apply a commit that was made by this script to the known paths of the given branch of the git repository."""
+        key = (self.git_repo.full_name, branch)
+        if key not in self.git_trees:
+            return
+        sha, paths = self.git_trees[key]
+        # Only do this if the commit directly follows the known one, so that we don't have to fetch the tree again.
+        # Otherwise someone else has committed in between, and the next lookup fetches the new tree.
+        if paths is not None and [parent.sha for parent in commit.parents] == [sha]:
+            self.git_trees[key] = (commit.sha, (paths - set(removed)) | set(added))
+
+    def get_git_metadata_file(self, state):
+        """Return the metadata file of this tarball from the given state's directory in the git repository."""
+        if state not in self.git_metadata_files:
+            self.git_metadata_files[state] = self.git_repo.get_contents(state + '/' + self.metadata_file)
+        return self.git_metadata_files[state]
 
     def get_contents_overview(self):
         """Return an overview of what is included in the tarball."""
         tar = tarfile.open(self.local_path, 'r')
         members = tar.getmembers()
         tar_num_members = len(members)
-        paths = sorted([m.path for m in members])
+        paths = sorted(m.path for m in members)
 
         if tar_num_members < 100:
             tar_members_desc = 'Full listing of the contents of the tarball:'
@@ -102,29 +150,37 @@ class EessiTarball:
             tar_members_desc = 'Summarized overview of the contents of the tarball:'
             # determine prefix after filtering out '<EESSI version>/init' subdirectory,
             # to get actual prefix for specific CPU target (like '2023.06/software/linux/aarch64/neoverse_v1')
-            init_subdir = os.path.join('*', 'init')
-            non_init_paths = sorted([p for p in paths if not any(x.match(init_subdir) for x in PurePosixPath(p).parents)])
+            # (a path is in such a subdirectory if any of its parent directories, except for the topmost one, is 'init')
+            non_init_paths = [p for p in paths if 'init' not in PurePosixPath(p).parts[1:-1]]
             if non_init_paths:
                 prefix = os.path.commonprefix(non_init_paths)
             else:
                 prefix = os.path.commonprefix(paths)
 
+            # patterns and directories that the members are compared against
+            swdir_pattern = os.path.join(prefix, 'software', '*', '*')
+            modfile_pattern = os.path.join(prefix, 'modules', '*', '*', '*.lua')
+            software_dir = PurePosixPath(prefix).joinpath('software')
+            modules_dir = PurePosixPath(prefix).joinpath('modules')
+            # pairs of each member and its parsed path, used by the filters below
+            member_paths = [(m, PurePosixPath(m.path)) for m in members]
+
             # TODO: this only works for software tarballs, how to handle compat layer tarballs?
             swdirs = [  # all directory names with the pattern: <prefix>/software/<name>/<version>
                 m.path
-                for m in members
-                if m.isdir() and PurePosixPath(m.path).match(os.path.join(prefix, 'software', '*', '*'))
+                for m, path in member_paths
+                if m.isdir() and path.match(swdir_pattern)
             ]
             modfiles = [  # all filenames with the pattern: <prefix>/modules/<category>/<name>/*.lua
                 m.path
-                for m in members
-                if m.isfile() and PurePosixPath(m.path).match(os.path.join(prefix, 'modules', '*', '*', '*.lua'))
+                for m, path in member_paths
+                if m.isfile() and path.match(modfile_pattern)
             ]
             other = [  # anything that is not in <prefix>/software nor <prefix>/modules
                 m.path
-                for m in members
-                if not PurePosixPath(prefix).joinpath('software') in PurePosixPath(m.path).parents
-                   and not PurePosixPath(prefix).joinpath('modules') in PurePosixPath(m.path).parents
+                for m, path in member_paths
+                if not software_dir in path.parents
+                   and not modules_dir in path.parents
                 # if not fnmatch.fnmatch(m.path, os.path.join(prefix, 'software', '*'))
                 # and not fnmatch.fnmatch(m.path, os.path.join(prefix, 'modules', '*'))
             ]
@@ -144,26 +200,26 @@ class EessiTarball:
 
     def next_state(self, state):
         """Find the next state for this tarball."""
-        if state in self.states and 'next_state' in self.states[state]:
-            return self.states[state]['next_state']
-        else:
-            return None
+        return self.states.get(state, {}).get('next_state')
 
     def run_handler(self):
         """Process this tarball by running the process function that corresponds to the current state."""
         if not self.state:
             self.state = self.find_state()
-        handler = self.states[self.state]['handler']
-        handler()
+        # Keep going for as long as the handlers move the tarball to a new state.
+        while True:
+            state = self.state
+            handler = self.states[state]['handler']
+            handler(self)
+            if self.state == state:
+                break
 
     def verify_checksum(self):
         """Verify the checksum of the downloaded tarball with the one in its metadata file."""
         local_sha256 = sha256sum(self.local_path)
-        meta_sha256 = None
-        with open(self.local_metadata_path, 'r') as meta:
-            meta_sha256 = json.load(meta)['payload']['sha256sum']
-        logging.debug(f'Checksum of downloaded tarball: {local_sha256}')
-        logging.debug(f'Checksum stored in metadata file: {meta_sha256}')
+        meta_sha256 = json.loads(self.get_metadata())['payload']['sha256sum']
+        logging.debug('Checksum of downloaded tarball: %s', local_sha256)
+        logging.debug('Checksum stored in metadata file: %s', meta_sha256)
         return local_sha256 == meta_sha256
 
     def ingest(self):
@@ -177,7 +233,7 @@ class EessiTarball:
             # Open issue?
             return
         else:
-            logging.debug(f'Checksum of {self.object} matches the one in its metadata file.')
+            logging.debug('Checksum of %s matches the one in its metadata file.', self.object)
         script = self.config['paths']['ingestion_script']
         sudo = ['sudo'] if self.config['cvmfs'].getboolean('ingest_as_root', True) else []
         logging.info(f'Running the ingestion script for {self.object}...')
@@ -191,7 +247,7 @@ class EessiTarball:
             if self.config.has_section('slack') and self.config['slack'].getboolean('ingestion_notification', False):
                 send_slack_message(
                     self.config['secrets']['slack_webhook'],
-                    self.config['slack']['ingestion_message'].format(tarball=os.path.basename(self.object), cvmfs_repo=self.cvmfs_repo)
+                    self.config['slack']['ingestion_message'].format(tarball=self.filename, cvmfs_repo=self.cvmfs_repo)
                 )
         else:
             issue_title = f'Failed to ingest {self.object}'
@@ -219,19 +275,17 @@ class EessiTarball:
         # Use force as it may be a new attempt for an existing tarball that failed before.
         self.download(force=True)
         if not self.local_path or not self.local_metadata_path:
-            logging.warn('Skipping this tarball...')
+            logging.warning('Skipping this tarball...')
             return
 
-        contents = ''
-        with open(self.local_metadata_path, 'r') as meta:
-            contents = meta.read()
+        contents = self.get_metadata()
 
         logging.info(f'Adding tarball\'s metadata to the "{next_state}" folder of the git repository.')
         file_path_staged = next_state + '/' + self.metadata_file
         new_file = self.git_repo.create_file(file_path_staged, 'new tarball', contents, branch='main')
+        self.update_git_tree_paths('main', new_file['commit'], added=[file_path_staged])
 
         self.state = next_state
-        self.run_handler()
 
     def print_rejected(self):
         """Process a (rejected) tarball for which the corresponding PR has been closed witout merging."""
@@ -245,25 +299,21 @@ class EessiTarball:
     def make_approval_request(self):
         """Process a staged tarball by opening a pull request for ingestion approval."""
         next_state = self.next_state(self.state)
-        file_path_staged = self.state + '/' + self.metadata_file
-        file_path_to_ingest = next_state + '/' + self.metadata_file
-
-        filename = os.path.basename(self.object)
-        tarball_metadata = self.git_repo.get_contents(file_path_staged)
-        git_branch = filename + '_' + next_state
+        git_branch = self.filename + '_' + next_state
         self.download()
 
-        main_branch = self.git_repo.get_branch('main')
-        if git_branch in [branch.name for branch in self.git_repo.get_branches()]:
+        if self.branch_exists(git_branch):
             # Existing branch found for this tarball, so we've run this step before.
             # Try to find out if there's already a PR as well...
             logging.info("Branch already exists for " + self.object)
-            # Filtering with only head=<branch name> returns all prs if there's no match, so double-check
-            find_pr = [pr for pr in self.git_repo.get_pulls(head=git_branch, state='all') if pr.head.ref == git_branch]
-            logging.debug('Found PRs: ' + str(find_pr))
-            if find_pr:
-                # So, we have a branch and a PR for this tarball (if there are more, pick the first one)...
-                pr = find_pr.pop(0)
+            # GitHub ignores a head filter with only a branch name and returns all PRs of the repository,
+            # so the filter needs to be <owner>:<branch name>; still double-check the branch of the results
+            head = f'{self.git_repo.owner.login}:{git_branch}'
+            # (if there are more PRs, pick the first one, so stop looking and don't fetch any further pages)
+            pr = next((pr for pr in self.git_repo.get_pulls(head=head, state='all') if pr.head.ref == git_branch), None)
+            logging.debug('Found PR: %s', pr)
+            if pr is not None:
+                # So, we have a branch and a PR for this tarball...
                 logging.info(f'PR {pr.number} found for {self.object}')
                 if pr.state == 'open':
                     # The PR is still open, so it hasn't been reviewed yet: ignore this tarball.
@@ -275,8 +325,8 @@ class EessiTarball:
                     self.reject()
                     return
                 else:
-                    logging.warn(f'Warning, tarball {self.object} is in a weird state:')
-                    logging.warn(f'Branch: {git_branch}\nPR: {pr}\nPR state: {pr.state}\nPR merged: {pr.merged}')
+                    logging.warning(f'Warning, tarball {self.object} is in a weird state:')
+                    logging.warning(f'Branch: {git_branch}\nPR: {pr}\nPR state: {pr.state}\nPR merged: {pr.merged}')
             else:
                 # There is a branch, but no PR for this tarball.
                 # This is weird, so let's remove the branch and reprocess the tarball.
@@ -286,13 +336,12 @@ class EessiTarball:
                 ref.delete()
         logging.info(f'Making pull request to get ingestion approval for {self.object}.')
         # Create a new branch
+        main_branch = self.git_repo.get_branch('main')
         self.git_repo.create_git_ref(ref='refs/heads/' + git_branch, sha=main_branch.commit.sha)
         # Move the file to the directory of the next stage in this branch
         self.move_metadata_file(self.state, next_state, branch=git_branch)
         # Get metadata file contents
-        metadata = ''
-        with open(self.local_metadata_path, 'r') as meta:
-            metadata = meta.read()
+        metadata = self.get_metadata()
         meta_dict = json.loads(metadata)
         repo, pr_id = meta_dict['link2pr']['repo'], meta_dict['link2pr']['pr']
         pr_url = f"https://github.com/{repo}/pull/{pr_id}"
@@ -302,10 +351,10 @@ class EessiTarball:
             pr_body = self.config['github']['pr_body'].format(
                 cvmfs_repo=self.cvmfs_repo,
                 pr_url=pr_url,
-                tar_overview=self.get_contents_overview(),
+                tar_overview=tarball_contents,
                 metadata=metadata,
             )
-            pr_title = '[%s] Ingest %s' % (self.cvmfs_repo, filename)
+            pr_title = '[%s] Ingest %s' % (self.cvmfs_repo, self.filename)
             self.git_repo.create_pull(title=pr_title, body=pr_body, head=git_branch, base='main')
         except Exception as err:
             issue_title = f'Failed to get contents of {self.object}'
@@ -313,22 +362,28 @@ class EessiTarball:
                 tarball=self.object,
                 error=err
             )
-            if len([i for i in self.git_repo.get_issues(state='open') if i.title == issue_title]) == 0:
-                self.git_repo.create_issue(title=issue_title, body=issue_body)
-            else:
+            if self.issue_exists(issue_title, state='open'):
                 logging.info(f'Failed to create tarball overview, but an issue already exists.')
+            else:
+                self.git_repo.create_issue(title=issue_title, body=issue_body)
 
     def move_metadata_file(self, old_state, new_state, branch='main'):
         """Move the metadata file of a tarball from an old state's directory to a new state's directory."""
         file_path_old = old_state + '/' + self.metadata_file
         file_path_new = new_state + '/' + self.metadata_file
-        logging.debug(f'Moving metadata file {self.metadata_file} from {file_path_old} to {file_path_new}.')
-        tarball_metadata = self.git_repo.get_contents(file_path_old)
+        logging.debug('Moving metadata file %s from %s to %s.', self.metadata_file, file_path_old, file_path_new)
+        tarball_metadata = self.get_git_metadata_file(old_state)
         # Remove the metadata file from the old state's directory...
-        self.git_repo.delete_file(file_path_old, 'remove from ' + old_state, sha=tarball_metadata.sha, branch=branch)
+        deleted = self.git_repo.delete_file(file_path_old, 'remove from ' + old_state, sha=tarball_metadata.sha,
+                                            branch=branch)
+        self.update_git_tree_paths(branch, deleted['commit'], removed=[file_path_old])
         # and move it to the new state's directory
-        self.git_repo.create_file(file_path_new, 'move to ' + new_state, tarball_metadata.decoded_content,
-                                  branch=branch)
+        created = self.git_repo.create_file(file_path_new, 'move to ' + new_state, tarball_metadata.decoded_content,
+                                            branch=branch)
+        self.update_git_tree_paths(branch, created['commit'], added=[file_path_new])
+        # Both directories have changed, so forget what we fetched from them before.
+        self.git_metadata_files.pop(old_state, None)
+        self.git_metadata_files.pop(new_state, None)
 
     def reject(self):
         """Reject a tarball for ingestion."""
@@ -337,11 +392,28 @@ class EessiTarball:
         next_state = 'rejected'
         self.move_metadata_file(self.state, next_state)
 
+    def branch_exists(self, branch):
+        """Check if a branch with the given name exists in the git repository."""
+        try:
+            self.git_repo.get_branch(branch)
+            return True
+        except github.GithubException as e:
+            # (older PyGithub versions raise a plain GithubException for the 'Branch not found' response)
+            if e.status == 404:
+                return False
+            raise
+
     def issue_exists(self, title, state='open'):
         """Check if an issue with the given title and state already exists."""
-        issues = self.git_repo.get_issues(state=state)
-        for issue in issues:
-            if issue.title == title and issue.state == state:
-                return True
-        else:
-            return False
+        return any(issue.title == title for issue in self.git_repo.get_issues(state=state))
+
+    # All states of a tarball, with the method that handles it and the state that follows it.
+    # (defined after the methods, so that it can refer to them directly)
+    states = {
+        'new': {'handler': mark_new_tarball_as_staged, 'next_state': 'staged'},
+        'staged': {'handler': make_approval_request, 'next_state': 'approved'},
+        'approved': {'handler': ingest, 'next_state': 'ingested'},
+        'ingested': {'handler': print_ingested},
+        'rejected': {'handler': print_rejected},
+        'unknown': {'handler': print_unknown},
+    }
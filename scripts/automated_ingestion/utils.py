@@ -21,7 +21,7 @@ def sha256sum(path):
     """Calculate the sha256 checksum of a given file."""
     sha256_hash = hashlib.sha256()
     with open(path, 'rb') as f:
-        # Read and update hash string value in blocks of 4K
-        for byte_block in iter(lambda: f.read(8192), b''):
+        # Read and update hash string value in blocks of 1M
+        for byte_block in iter(lambda: f.read(1024 * 1024), b''):
             sha256_hash.update(byte_block)
         return sha256_hash.hexdigest()
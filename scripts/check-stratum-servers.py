@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import argparse
+import concurrent.futures
 import datetime
 import re
 import sys
@@ -28,6 +29,12 @@ def error(msg):
     sys.exit(1)
 
 
+def fetch_urls_async(urls):
+    """Read the given URLs concurrently, and return a dict that maps each URL to the (finished) future of its contents."""
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(8, len(urls)) or 1) as executor:
+        return {url: executor.submit(lambda u: urllib.request.urlopen(u).read(), url) for url in urls}
+
+
 def find_stratum_urls(vars_file, fqrn):
     """Find all Stratum 0/1 URLs in a given Ansible YAML vars file that contains the EESSI CVMFS configuration."""
     try:
@@ -53,15 +60,16 @@ def check_revisions(stratum_urls, fqrn):
     """Check if the Stratum servers are serving the same revision of the repository."""
     errors = []
     revisions = {}
+    # Get a URL for the CVMFS manifest file of each server, and fetch them all at once.
+    manifest_files = {stratum: stratum + '/' + REPO_MANIFEST_FILE for stratum in stratum_urls}
+    manifests = fetch_urls_async(list(manifest_files.values()))
     for stratum in stratum_urls:
-        # Get a URL for the CVMFS manifest file.
-        manifest_file = stratum + '/' + REPO_MANIFEST_FILE
         try:
-            manifest = urllib.request.urlopen(manifest_file).read()
+            manifest = manifests[manifest_files[stratum]].result()
             # Find the revision number.
-            rev_matches = re.findall(rb'\nS([0-9]+)\n', manifest)
-            if rev_matches:
-                revisions[stratum] = int(rev_matches[0])
+            rev_match = re.search(rb'\nS([0-9]+)\n', manifest)
+            if rev_match:
+                revisions[stratum] = int(rev_match.group(1))
             else:
                 errors.append(f'Could not find revision number for stratum {stratum}!')
         except urllib.error.HTTPError as e:
@@ -84,11 +92,13 @@ def check_snapshots(s1_urls, fqrn, max_snapshot_delay=DEFAULT_MAX_SNAPSHOT_DELAY
     errors = []
     last_snapshots = {}
     now = datetime.datetime.utcnow()
+    # Get a URL for the CVMFS last snapshot json file of each server, and fetch them all at once.
+    s1_snapshot_files = {s1: s1.replace('@fqrn@', fqrn) + '/' + LAST_SNAPSHOT_FILE for s1 in s1_urls}
+    last_snapshot_contents = fetch_urls_async(list(s1_snapshot_files.values()))
     for s1 in s1_urls:
-        # Get a URL for the CVMFS last snapshot json file.
-        s1_snapshot_file = s1.replace('@fqrn@', fqrn) + '/' + LAST_SNAPSHOT_FILE
+        s1_snapshot_file = s1_snapshot_files[s1]
         try:
-            last_snapshot = urllib.request.urlopen(s1_snapshot_file).read().strip().decode('UTF-8')
+            last_snapshot = last_snapshot_contents[s1_snapshot_file].result().strip().decode('UTF-8')
             # Parse the timestamp in the json file.
             last_snapshot_time = datetime.datetime.strptime(last_snapshot, "%a %b %d %H:%M:%S %Z %Y")
             last_snapshots[s1] = last_snapshot_time
@@ -98,7 +108,7 @@ def check_snapshots(s1_urls, fqrn, max_snapshot_delay=DEFAULT_MAX_SNAPSHOT_DELAY
                 errors.append(
                     f'Stratum 1 {s1} has made its last snapshot {(now - last_snapshot_time).seconds / 60:.0f} minutes ago!')
         except urllib.error.HTTPError as e:
-            errors.append(f'Could not connect to {s1_json}!')
+            errors.append(f'Could not connect to {s1_snapshot_file}!')
 
     if last_snapshots:
         # Get the Stratum 1 with the most recent snapshot...